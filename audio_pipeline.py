@@ -0,0 +1,90 @@
+"""Transcodage audio en mémoire : un seul processus ffmpeg, entrée et sortie par pipes."""
+import shutil, asyncio, subprocess, threading
+
+# Formats de sortie compacts pour la voix (16 kHz mono)
+FORMATS = {
+    "opus": (["-c:a", "libopus", "-application", "voip", "-f", "ogg"], "audio/ogg"),
+    "mp3": (["-c:a", "libmp3lame", "-f", "mp3"], "audio/mp3"),
+}
+
+# Supprime le silence au début puis (via areverse) à la fin de l'enregistrement
+TRIM_FILTER = (
+    "silenceremove=start_periods=1:start_threshold={db}dB:start_silence=0.1,"
+    "areverse,"
+    "silenceremove=start_periods=1:start_threshold={db}dB:start_silence=0.1,"
+    "areverse"
+)
+
+_ffmpeg_path = None
+_ffmpeg_lock = threading.Lock()
+
+
+def ffmpeg_path():
+    """Chemin de ffmpeg, résolu une seule fois par processus ('' si absent)."""
+    global _ffmpeg_path
+    if _ffmpeg_path is None:
+        with _ffmpeg_lock:
+            if _ffmpeg_path is None:
+                _ffmpeg_path = shutil.which("ffmpeg") or ""
+    return _ffmpeg_path
+
+
+def _command(fmt, bitrate, trim_silence, silence_db):
+    exe = ffmpeg_path()
+    if not exe: raise RuntimeError("ffmpeg introuvable")
+    codec_args, mime = FORMATS[fmt]
+    cmd = [exe, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-vn", "-ac", "1", "-ar", "16000"]
+    if trim_silence: cmd += ["-af", TRIM_FILTER.format(db=silence_db)]
+    cmd += codec_args[:2] + ["-b:a", bitrate] + codec_args[2:] + ["pipe:1"]
+    return cmd, mime
+
+
+def _check(returncode, out, err):
+    if returncode != 0 or not out:
+        raise RuntimeError(f"ffmpeg: {err.decode('utf-8', 'replace').strip()[-300:]}")
+
+
+def transcode(data, fmt="opus", bitrate="24k", trim_silence=False, silence_db=-45, timeout=30):
+    """Convertit `data` (webm du navigateur) en audio parole compact.
+
+    Retourne (octets, mime). Les octets passent par stdin/stdout de ffmpeg,
+    sans aucun fichier temporaire. Lève une exception si ffmpeg échoue.
+    """
+    cmd, mime = _command(fmt, bitrate, trim_silence, silence_db)
+    proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    _check(proc.returncode, proc.stdout, proc.stderr)
+    return proc.stdout, mime
+
+
+async def transcode_async(data, fmt="opus", bitrate="24k", trim_silence=False, silence_db=-45, timeout=30):
+    """Comme `transcode`, sans bloquer la boucle asyncio."""
+    cmd, mime = _command(fmt, bitrate, trim_silence, silence_db)
+    proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(data), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    _check(proc.returncode, out, err)
+    return out, mime
+
+
+def prepare_audio(data, source_mime="video/webm", **kw):
+    """Transcode si possible, sinon renvoie l'upload tel quel (comme avant sans ffmpeg)."""
+    if not ffmpeg_path(): return data, source_mime
+    try:
+        return transcode(data, **kw)
+    except Exception as e:
+        print(f"⚠️ Transcodage audio ignoré: {e}")
+        return data, source_mime
+
+
+async def prepare_audio_async(data, source_mime="video/webm", **kw):
+    """Version asyncio de `prepare_audio`."""
+    if not ffmpeg_path(): return data, source_mime
+    try:
+        return await transcode_async(data, **kw)
+    except Exception as e:
+        print(f"⚠️ Transcodage audio ignoré: {e}")
+        return data, source_mime
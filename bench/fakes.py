@@ -0,0 +1,168 @@
+"""Doublures locales pour le benchmark : Gemini (latence + PROCESSING), serveur TTS HTTP, clips webm."""
+import os, json, time, random, shutil, asyncio, tempfile, itertools, threading, subprocess
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Latency:
+    """Latence aléatoire : moyenne `mean` secondes, écart-type `jitter` (tronquée à 0)."""
+
+    def __init__(self, mean, jitter=0.0):
+        self.mean, self.jitter = mean, jitter
+
+    def sample(self):
+        return max(0.0, random.gauss(self.mean, self.jitter)) if self.jitter else self.mean
+
+
+# --- GEMINI ---
+
+class FakeGemini:
+    """Remplace les fonctions de google.generativeai utilisées par le backend."""
+
+    def __init__(self, latency, upload_latency, processing_delay, condense_latency):
+        self.latency = latency
+        self.upload_latency = upload_latency
+        self.processing_delay = processing_delay
+        self.condense_latency = condense_latency
+        self._files = {}
+        self._ids = itertools.count()  # Jamais réutilisé, même après delete_file
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def install(self, genai):
+        fake = self
+
+        class Model:
+            def __init__(self, model_name=None, system_instruction=None, **kw):
+                self.system_instruction = system_instruction
+
+            @classmethod
+            def from_cached_content(cls, cached_content, **kw):
+                return cls()
+
+            def generate_content(self, contents, **kw):
+                time.sleep(fake.condense_latency.sample())
+                return fake._profile()
+
+            async def generate_content_async(self, contents, **kw):
+                await asyncio.sleep(fake.condense_latency.sample())
+                return fake._profile()
+
+            def start_chat(self, history=None):
+                return Chat(history or [])
+
+        class Chat:
+            def __init__(self, history):
+                self.history = history
+
+            def send_message(self, parts, **kw):
+                time.sleep(fake.latency.sample())
+                return fake._answer(self.history)
+
+            async def send_message_async(self, parts, **kw):
+                await asyncio.sleep(fake.latency.sample())
+                return fake._answer(self.history)
+
+        genai.GenerativeModel = Model
+        genai.upload_file = self.upload_file
+        genai.get_file = self.get_file
+        genai.delete_file = self.delete_file
+
+    def _file(self, name, ready_at):
+        state = "ACTIVE" if time.monotonic() >= ready_at else "PROCESSING"
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=state))
+
+    def upload_file(self, path, mime_type=None, **kw):
+        time.sleep(self.upload_latency.sample())
+        with self._lock:
+            name = f"files/bench-{next(self._ids)}"
+            self._files[name] = time.monotonic() + self.processing_delay.sample()
+            return self._file(name, self._files[name])
+
+    def get_file(self, name):
+        time.sleep(0.02)
+        with self._lock:
+            return self._file(name, self._files[name])
+
+    def delete_file(self, name):
+        with self._lock:
+            self._files.pop(name, None)
+
+    def _profile(self):
+        return SimpleNamespace(text=json.dumps({"headline": "Backend engineer", "experiences": ["Dev @ Acme (2019-2024): cut p95 latency by 40%"], "skills": ["Python", "SQL"]}))
+
+    def _answer(self, history):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        return SimpleNamespace(text=json.dumps({
+            "coach_response_text": f"Thanks. That was answer number {n}. Can you give me a concrete example with numbers? What was the impact on the team?",
+            "transcription_user": "I led the migration of our billing service and reduced incidents.",
+            "score_pronunciation": 7, "feedback_intonation": "Good rhythm.", "feedback_grammar": "Say 'I led', not 'I have led'.",
+            "better_response_example": "In 2023 I led the billing migration, which cut incidents by 30%.",
+            "next_step_advice": "Quantify your results."}))
+
+
+# --- TTS ---
+
+class FakeTTSServer:
+    """Serveur HTTP local qui imite translate_tts : renvoie des octets « MP3 » après une latence."""
+
+    def __init__(self, latency, bytes_per_char=120):
+        latency_ref, bpc = latency, bytes_per_char
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, comme l'endpoint réel
+
+            def do_GET(self):
+                time.sleep(latency_ref.sample())
+                body = b"\xff\xfb\x90\x00" * max(1, (len(self.path) * bpc) // 4)
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/translate_tts?tl={{voice}}&q={{text}}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+# --- CLIPS AUDIO ---
+
+def make_clips(directory, durations=(3, 8, 15)):
+    """Génère des réponses webm/Opus (parole simulée) ; sans ffmpeg, des octets bruts de taille comparable."""
+    ffmpeg = shutil.which("ffmpeg")
+    clips = []
+    for d in durations:
+        path = os.path.join(directory, f"answer_{d}s.webm")
+        if ffmpeg:
+            # 0,5 s de silence de chaque côté, pour que le trim ait du travail
+            subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+                            "-f", "lavfi", "-i", f"sine=frequency=220:duration={d}:sample_rate=48000",
+                            "-af", "adelay=500|500,apad=pad_dur=0.5,volume=0.3",
+                            "-c:a", "libopus", "-b:a", "48k", "-f", "webm", path], check=True)
+        else:
+            with open(path, "wb") as fh: fh.write(os.urandom(6000 * d))
+        with open(path, "rb") as fh: clips.append((os.path.basename(path), fh.read()))
+    return clips
+
+
+def temp_dir():
+    return tempfile.mkdtemp(prefix="coach-bench-")
+
+
+CV_SAMPLE = "\n".join(
+    f"{year}-{year + 2}: Software engineer at Company {i}. Built data pipelines, reduced costs by {10 + i}%, "
+    f"mentored {i + 2} engineers, led the migration of service {i} to Kubernetes."
+    for i, year in enumerate(range(2008, 2024, 2))
+) * 3
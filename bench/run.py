@@ -0,0 +1,236 @@
+"""Benchmark hors-ligne : rejoue des entretiens complets contre le backend servi par gunicorn.
+
+Gemini, TTS et PostgreSQL sont remplacés localement (doublure Gemini, serveur
+TTS HTTP local, SQLite). Rapporte p50/p95/p99 par route et par étape
+(en-tête Server-Timing), le débit et le pic de RSS du worker, puis enregistre
+le résultat en JSON pour comparer deux builds. Le démarrage est mesuré deux fois :
+lancement -> /health prêt côté client, et jalons import -> première réponse côté serveur.
+
+    python -m bench.run --sessions 20 --turns 5 --concurrency 8
+    python -m bench.run --mode async --stream --baseline bench/results/baseline.json
+"""
+import os, sys, json, math, time, signal, socket, argparse, datetime, platform, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.fakes import FakeTTSServer, Latency, make_clips, temp_dir, CV_SAMPLE
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("--mode", choices=["sync", "async"], default="sync")
+    p.add_argument("--sessions", type=int, default=20, help="Entretiens rejoués")
+    p.add_argument("--turns", type=int, default=5, help="Réponses par entretien")
+    p.add_argument("--concurrency", type=int, default=8, help="Entretiens simultanés")
+    p.add_argument("--stream", action="store_true", help="Utilise /analyze/stream au lieu de /analyze")
+    p.add_argument("--upload", action="store_true", help="Force le chemin upload_file + PROCESSING")
+    p.add_argument("--gemini-latency", default="1.5:0.4", help="moyenne:écart-type (s)")
+    p.add_argument("--upload-latency", default="0.3:0.1")
+    p.add_argument("--processing-delay", default="1.0:0.5")
+    p.add_argument("--condense-latency", default="2.0:0.5")
+    p.add_argument("--tts-latency", default="0.25:0.08")
+    p.add_argument("--threads", type=int, default=4, help="Threads gunicorn (mode sync)")
+    p.add_argument("--out", default=RESULTS_DIR)
+    p.add_argument("--baseline", help="JSON d'un run précédent à comparer")
+    p.add_argument("--threshold", type=float, default=0.15, help="Régression tolérée sur p95 (0.15 = +15 %%)")
+    p.add_argument("--save-baseline", action="store_true", help="Écrit aussi le résultat dans --baseline")
+    return p.parse_args(argv)
+
+
+def percentiles(values):
+    if not values: return {}
+    s = sorted(values)
+    pick = lambda q: s[max(0, math.ceil(q * len(s)) - 1)]  # Rang le plus proche
+    return {"n": len(s), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": s[-1]}
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, dur = part.strip().partition(";dur=")
+        if name and dur: stages[name] = float(dur) / 1000
+    return stages
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- SERVEUR ---
+
+def start_server(args, port, tts_url, work_dir):
+    env = dict(os.environ,
+               GOOGLE_API_KEY="bench", DATABASE_URL=f"sqlite:///{os.path.join(work_dir, 'bench.db')}",
+               TTS_URL=tts_url, CONTEXT_CACHE="0", BENCH_MODE=args.mode,
+               BENCH_GEMINI_LATENCY=args.gemini_latency, BENCH_UPLOAD_LATENCY=args.upload_latency, BENCH_PROCESSING_DELAY=args.processing_delay,
+               BENCH_CONDENSE_LATENCY=args.condense_latency)
+    if args.upload: env["INLINE_AUDIO_MAX_BYTES"] = "0"
+    cmd = [sys.executable, "-m", "gunicorn", "--chdir", ROOT, "--bind", f"127.0.0.1:{port}", "--workers", "1", "--timeout", "120"]
+    if args.mode == "async": cmd += ["--worker-class", "uvicorn.workers.UvicornWorker"]
+    else: cmd += ["--threads", str(args.threads)]
+    proc = subprocess.Popen(cmd + ["bench.serve:app"], env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(work_dir, "server.log"), "wb"))
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < 60:
+        if proc.poll() is not None: raise RuntimeError(f"gunicorn s'est arrêté, voir {work_dir}/server.log")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                return proc, time.perf_counter() - t0
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Le serveur n'a pas démarré en 60 s")
+
+
+def worker_peak_rss(master_pid):
+    """Pic de mémoire résidente (VmHWM, Mo) du worker gunicorn, lu dans /proc (Linux)."""
+    peak = None
+    try:
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit(): continue
+            try:
+                with open(f"/proc/{pid}/status") as fh: status = dict(l.split(":", 1) for l in fh if ":" in l)
+            except OSError:
+                continue
+            if int(status.get("PPid", "0").strip()) == master_pid and "VmHWM" in status:
+                kb = int(status["VmHWM"].split()[0])
+                peak = max(peak or 0, kb / 1024)
+    except OSError:
+        pass
+    return peak
+
+
+# --- CLIENT ---
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes, self.stages, self.errors = {}, {}, {}
+
+    def add(self, route, seconds, ok, stages=None):
+        with self.lock:
+            self.routes.setdefault(route, []).append(seconds)
+            if not ok: self.errors[route] = self.errors.get(route, 0) + 1
+            for name, dur in (stages or {}).items():
+                self.stages.setdefault(f"{route}/{name}", []).append(dur)
+
+
+def json_body(r):
+    """Corps JSON, ou {} si la réponse n'en est pas (page d'erreur gunicorn, timeout...)."""
+    try: return r.json()
+    except ValueError: return {}
+
+
+def interview(i, base, args, clips, rec):
+    http = requests.Session()
+    sid = f"bench_{i}_{int(time.time() * 1000)}"
+    t = time.perf_counter()
+    r = http.post(f"{base}/start_chat", json={"session_id": sid, "candidate_name": f"Candidate {i}", "job_title": "Backend Engineer", "company_type": "Scale-up", "cv_content": CV_SAMPLE}, timeout=120)
+    rec.add("start_chat", time.perf_counter() - t, r.ok, parse_server_timing(r.headers.get("Server-Timing")))
+    if not r.ok: return
+
+    for turn in range(args.turns):
+        name, clip = clips[(i + turn) % len(clips)]
+        files = {"audio": (name, clip, "audio/webm")}
+        t = time.perf_counter()
+        if args.stream:
+            r = http.post(f"{base}/analyze/stream", data={"session_id": sid}, files=files, stream=True, timeout=120)
+            stages = parse_server_timing(r.headers.get("Server-Timing"))
+            # En streaming, `total` s'arrête à l'envoi des en-têtes : renommé pour ne pas tromper
+            if "total" in stages: stages["headers"] = stages.pop("total")
+            first_audio, ok = None, r.ok
+            for line in r.iter_lines(decode_unicode=True):
+                if line == "event: audio" and first_audio is None: first_audio = time.perf_counter() - t
+                elif line == "event: error": ok = False
+            if first_audio is not None: rec.add("analyze_stream/first_audio", first_audio, True)
+            rec.add("analyze_stream", time.perf_counter() - t, ok, stages)
+        else:
+            r = http.post(f"{base}/analyze", data={"session_id": sid}, files=files, timeout=120)
+            rec.add("analyze", time.perf_counter() - t, r.ok and "error" not in json_body(r), parse_server_timing(r.headers.get("Server-Timing")))
+
+
+# --- RAPPORT ---
+
+def compare(result, baseline, threshold):
+    """Liste des régressions de p95 par route par rapport à `baseline`."""
+    regressions = []
+    for route, cur in result["routes"].items():
+        ref = baseline.get("routes", {}).get(route)
+        if not ref or not ref.get("p95"): continue
+        ratio = cur["p95"] / ref["p95"]
+        if ratio > 1 + threshold: regressions.append(f"{route}: p95 {ref['p95'] * 1000:.0f} ms -> {cur['p95'] * 1000:.0f} ms (+{(ratio - 1) * 100:.0f} %)")
+    return regressions
+
+
+def print_report(result):
+    print(f"\n=== {result['mode']} | {result['sessions']} entretiens x {result['turns']} tours | concurrence {result['concurrency']} ===")
+    print(f"Durée {result['wall_seconds']:.1f} s | {result['turns_per_second']:.2f} tours/s | démarrage {result['startup_seconds']:.2f} s | pic RSS worker {result['peak_rss_mb'] or '?'} Mo")
+    if result["server_startup"]: print("Jalons serveur (s depuis l'import) : " + ", ".join(f"{k} {v:.2f}" for k, v in result["server_startup"].items()))
+    print(f"{'route / étape':42} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for section in ("routes", "stages"):
+        for name, p in sorted(result[section].items()):
+            print(f"{name:42} {p['n']:>5} {p['p50'] * 1000:>7.0f}ms {p['p95'] * 1000:>7.0f}ms {p['p99'] * 1000:>7.0f}ms")
+    if result["errors"]: print(f"Erreurs : {result['errors']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = temp_dir()
+    clips = make_clips(work_dir)
+    tts = FakeTTSServer(Latency(*[float(x) for x in args.tts_latency.split(":")])).start()
+    port = free_port()
+    proc, startup = start_server(args, port, tts.url, work_dir)
+    base = f"http://127.0.0.1:{port}"
+    rec = Recorder()
+    try:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for f in [pool.submit(interview, i, base, args, clips, rec) for i in range(args.sessions)]: f.result()
+        wall = time.perf_counter() - t0
+        peak_rss = worker_peak_rss(proc.pid)
+        # Jalons mesurés par le serveur : import, schéma, pré-chauffage, première réponse
+        server_startup = requests.get(f"{base}/health", timeout=10).json().get("startup", {})
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(30)
+        tts.stop()
+
+    result = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(), "python": platform.python_version(),
+        "mode": args.mode, "stream": args.stream, "upload": args.upload,
+        "sessions": args.sessions, "turns": args.turns, "concurrency": args.concurrency,
+        "latencies": {"gemini": args.gemini_latency, "upload": args.upload_latency, "processing": args.processing_delay, "condense": args.condense_latency, "tts": args.tts_latency},
+        "wall_seconds": wall, "turns_per_second": args.sessions * args.turns / wall,
+        "startup_seconds": startup, "server_startup": server_startup, "peak_rss_mb": round(peak_rss, 1) if peak_rss else None,
+        "routes": {k: percentiles(v) for k, v in rec.routes.items()},
+        "stages": {k: percentiles(v) for k, v in rec.stages.items()},
+        "errors": rec.errors,
+    }
+    print_report(result)
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{result['timestamp'].replace(':', '')}-{args.mode}.json")
+    with open(path, "w") as fh: json.dump(result, fh, indent=2)
+    print(f"\nRésultat enregistré : {path}")
+
+    if args.baseline:
+        if args.save_baseline or not os.path.exists(args.baseline):
+            with open(args.baseline, "w") as fh: json.dump(result, fh, indent=2)
+            print(f"Référence écrite : {args.baseline}")
+        else:
+            with open(args.baseline) as fh: regressions = compare(result, json.load(fh), args.threshold)
+            if regressions:
+                print("❌ RÉGRESSIONS :\n  " + "\n  ".join(regressions))
+                return 1
+            print("✅ Pas de régression de p95 par rapport à la référence.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
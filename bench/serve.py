@@ -0,0 +1,32 @@
+"""Point d'entrée gunicorn du benchmark : le vrai backend, avec Gemini remplacé par une doublure.
+
+Configuration par variables d'environnement (posées par bench/run.py) :
+BENCH_MODE (sync | async), BENCH_GEMINI_LATENCY, BENCH_UPLOAD_LATENCY,
+BENCH_PROCESSING_DELAY, BENCH_CONDENSE_LATENCY au format "moyenne:écart-type" en secondes.
+"""
+import os
+
+from bench.fakes import FakeGemini, Latency
+
+
+def _latency(name, default):
+    mean, _, jitter = os.getenv(name, default).partition(":")
+    return Latency(float(mean), float(jitter or 0))
+
+
+fake_gemini = FakeGemini(
+    latency=_latency("BENCH_GEMINI_LATENCY", "1.5:0.4"),
+    upload_latency=_latency("BENCH_UPLOAD_LATENCY", "0.3:0.1"),
+    processing_delay=_latency("BENCH_PROCESSING_DELAY", "1.0:0.5"),
+    condense_latency=_latency("BENCH_CONDENSE_LATENCY", "2.0:0.5"),
+)
+
+import english_coach_backend as core
+
+# genai est importé à la demande : la doublure remplace ses attributs sans charger le vrai module
+fake_gemini.install(core.genai)
+
+if os.getenv("BENCH_MODE", "sync") == "async":
+    from english_coach_async import app
+else:
+    app = core.app
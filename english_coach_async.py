@@ -0,0 +1,221 @@
+"""Mode asynchrone (ASGI) : mêmes routes et mêmes JSON que english_coach_backend, sur une boucle asyncio.
+
+Un seul worker sert des dizaines d'entretiens en parallèle : Gemini (gRPC aio),
+TTS (httpx) et ffmpeg ne bloquent plus de thread pendant l'attente.
+
+Lancement : gunicorn -k uvicorn.workers.UvicornWorker english_coach_async:app
+"""
+import os, json, asyncio
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+
+import english_coach_backend as core
+from audio_pipeline import prepare_audio_async
+from tts_cache import AsyncTTS
+import metrics
+from metrics import span
+
+# --- LIMITES DE CONCURRENCE PAR SERVICE ---
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "16"))
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "16"))
+DB_CONCURRENCY = int(os.getenv("DB_CONCURRENCY", str(core.DB_POOL_SIZE)))
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", "2"))  # CPU : un conteneur = 1-2 vCPU
+
+gemini_limit = asyncio.Semaphore(GEMINI_CONCURRENCY)
+db_limit = asyncio.Semaphore(DB_CONCURRENCY)
+ffmpeg_limit = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+
+tts = AsyncTTS(core.tts_cache, pool_size=TTS_CONCURRENCY, timeout=(core.TTS_CONNECT_TIMEOUT, core.TTS_READ_TIMEOUT),
+               retries=core.TTS_RETRIES, concurrency=TTS_CONCURRENCY)
+
+app = cors(Quart(__name__, static_folder='.', static_url_path=''))
+
+@app.after_serving
+async def shutdown():
+    await tts.aclose()
+
+# --- ÉTAPES ---
+
+async def db(fn, *args):
+    """Appel à la couche de stockage (pool psycopg2 / sqlite) dans un thread, borné par DB_CONCURRENCY."""
+    async with db_limit:
+        return await asyncio.to_thread(fn, *args)
+
+async def generate_ai_voice(text):
+    try:
+        with span("tts"):
+            b64 = await tts.synthesize_b64(text, voice=core.TTS_VOICE)
+        metrics.audio_bytes("out", len(b64) * 3 // 4)
+        return b64
+    except Exception as e:
+        metrics.upstream_error("tts")
+        print(f"❌ CRITIQUE: Échec Audio G-TTS: {e}")
+        return ""
+
+async def condense_cv(cv_content):
+    if not core.needs_condensing(cv_content): return None
+    try:
+        with span("condense"):
+            async with gemini_limit:
+                resp = await core.genai.GenerativeModel(core.MODEL_NAME).generate_content_async([core.CONDENSE_INSTRUCTIONS, cv_content], generation_config=core.PROFILE_CONFIG)
+        return core.compact_profile(resp.text)
+    except Exception as e:
+        metrics.upstream_error("gemini")
+        print(f"⚠️ Condensation CV échouée, CV brut utilisé: {e}")
+        return None
+
+async def read_audio(f):
+    data = f.read()
+    metrics.audio_bytes("in", len(data))
+    with span("transcode"):
+        async with ffmpeg_limit:
+            audio, mime = await prepare_audio_async(data, source_mime="video/webm", fmt=core.AUDIO_FORMAT, bitrate=core.AUDIO_BITRATE, trim_silence=core.AUDIO_TRIM_SILENCE)
+    metrics.audio_bytes("transcoded", len(audio))
+    return audio, mime
+
+async def ask_gemini(sid, sess, audio, mime):
+    """Envoie le tour à Gemini et renvoie l'analyse (l'enregistrement est fait par l'appelant)."""
+    # Cache modèle : un miss peut créer un CachedContent (appel bloquant), d'où le thread
+    with span("model"):
+        model, prompt_tokens = await asyncio.to_thread(core.get_session_model, sess)
+    with span("history"):
+        hist = core.budget_history(await db(core.get_hist, sid), prompt_tokens)
+    chat = model.start_chat(history=hist)
+
+    if len(audio) <= core.INLINE_AUDIO_MAX_BYTES:
+        part, u_name = {"mime_type": mime, "data": audio}, None
+    else:
+        # Chemin rare (gros fichier) : upload + attente PROCESSING dans un thread
+        async with gemini_limit:
+            part, u_name = await asyncio.to_thread(core.make_audio_part, audio, mime)
+    try:
+        with span("gemini"):
+            async with gemini_limit:
+                resp = await chat.send_message_async([part, "Analyze."], generation_config=core.ANALYZE_CONFIG)
+    finally:
+        if u_name: core.writer.submit(core.delete_gemini_file, u_name)
+    with span("parse"):
+        return json.loads(core.clean_json(resp.text))
+
+async def save_turn(sid, res):
+    with span("save"):
+        await db(core.save_turn, sid, res)
+
+# --- ROUTES ---
+
+@app.before_request
+async def start_timing():
+    metrics.begin_request(request.endpoint)
+
+@app.after_request
+async def add_server_timing(response):
+    timing = metrics.end_request(response.status_code)
+    if timing: response.headers['Server-Timing'] = timing
+    if request.endpoint not in ('health', 'prometheus_metrics'): core.startup.mark("first_response")
+    return response
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, mimetype=content_type)
+
+@app.route('/')
+async def index(): return await app.send_static_file('index.html')
+
+@app.route('/health', methods=['GET'])
+async def health():
+    if not core.schema_ready.is_set(): return jsonify({"status": "starting", "startup": core.startup.phases}), 503
+    status = "ok" if await db(core.store.ping) else "disconnected"
+    if status != "ok": metrics.upstream_error("db")
+    return jsonify({"status": "ok", "db": status, "startup": core.startup.phases})
+
+@app.route('/start_chat', methods=['POST'])
+async def start_chat():
+    d = await request.get_json()
+    sid = d.get('session_id')
+    cv_content = core.clean_cv(d.get('cv_content', None))
+
+    with span("db_session"):
+        cv_profile = core.known_profile(await db(core.get_sess, sid), cv_content)
+    if cv_profile is None: cv_profile = await condense_cv(cv_content)
+    with span("db_save"):
+        await db(core.save_sess, sid, d['candidate_name'], d['job_title'], d['company_type'], cv_content, cv_profile)
+
+    msg = core.greeting(d['candidate_name'], d['job_title'])
+    # Enregistrement et synthèse vocale en parallèle
+    _, audio = await asyncio.gather(db(core.save_msg, sid, "model", msg), generate_ai_voice(msg))
+
+    return jsonify({"coach_response_text": msg, "audio_base64": audio, "transcription_user": "", "score_pronunciation": 10, "feedback_grammar": "", "better_response_example": "N/A"})
+
+@app.route('/analyze', methods=['POST'])
+async def analyze():
+    form, files = await request.form, await request.files
+    sid = form.get('session_id')
+    f = files.get('audio')
+
+    with span("db_session"):
+        sess = await db(core.get_sess, sid)
+    if not sess: return jsonify({"error": "Session lost"}), 404
+
+    try:
+        audio, mime = await read_audio(f)
+    except: return jsonify({"error": "File error"}), 500
+
+    try:
+        res = await ask_gemini(sid, sess, audio, mime)
+        _, res["audio_base64"] = await asyncio.gather(save_turn(sid, res), generate_ai_voice(res.get("coach_response_text")))
+        return jsonify(res)
+    except Exception as e:
+        metrics.upstream_error("gemini")
+        print(f"CRITICAL: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/analyze/stream', methods=['POST'])
+async def analyze_stream():
+    """Même flux d'événements que english_coach_backend.analyze_stream."""
+    form, files = await request.form, await request.files
+    sid = form.get('session_id')
+    f = files.get('audio')
+
+    with span("db_session"):
+        sess = await db(core.get_sess, sid)
+    if not sess: return jsonify({"error": "Session lost"}), 404
+
+    try:
+        audio, mime = await read_audio(f)
+    except: return jsonify({"error": "File error"}), 500
+
+    req = metrics.current()
+
+    async def events():
+        metrics.resume(req)
+        try:
+            res = await ask_gemini(sid, sess, audio, mime)
+        except Exception as e:
+            metrics.upstream_error("gemini")
+            print(f"CRITICAL: {e}")
+            yield core.sse("error", {"error": str(e)})
+            return
+        saving = asyncio.ensure_future(save_turn(sid, dict(res)))
+        text = res.pop("coach_response_text", "")
+        yield core.sse("analysis", res)
+        yield core.sse("coach", {"coach_response_text": text})
+        try:
+            with span("tts"):
+                i = 0
+                async for chunk in tts.iter_b64(text, voice=core.TTS_VOICE):
+                    metrics.audio_bytes("out", len(chunk) * 3 // 4)
+                    yield core.sse("audio", {"index": i, "audio_base64": chunk})
+                    i += 1
+        except Exception as e:
+            metrics.upstream_error("tts")
+            print(f"❌ CRITIQUE: Échec Audio G-TTS: {e}")
+        await saving
+        metrics.resume(None)
+        yield core.sse("done", {})
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=True)
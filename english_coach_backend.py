@@ -1,13 +1,19 @@
-import os, sys, tempfile, json, datetime, time, shutil, base64
+import os, sys, io, json, datetime, time, atexit, threading
+IMPORT_STARTED = time.monotonic()  # Référence de la mesure import -> première réponse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from contextlib import contextmanager
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from pydub import AudioSegment
-import google.generativeai as genai
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import requests 
-from urllib.parse import quote 
+from session_store import create_store, StoreUnavailable, HistoryCache
+from write_behind import WriteBehind
+from tts_cache import TTSClient, TTSCache
+from audio_pipeline import prepare_audio, ffmpeg_path
+from model_cache import ModelCache, profile_key
+from prompt_budget import estimate_tokens, fit_history
+from lazy_import import LazyModule
+import metrics
+from metrics import span
 
 # --- CONFIGURATION INITIALE ---
 load_dotenv(override=True)
@@ -16,112 +22,173 @@ API_KEY = os.getenv("GOOGLE_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL") 
 MODEL_NAME = 'gemini-2.5-flash' 
 COACH_NAME = 'Sarah' 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "6"))  # Threads gunicorn (4) + marge pour /health et le pré-chauffage
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", "40"))  # Fenêtre lue en base (plafond strict : les tours plus anciens ne sont ni envoyés ni résumés)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))  # Prompt système + historique
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "300"))  # Résumé des tours plus anciens
+CV_CONDENSE_MIN_CHARS = int(os.getenv("CV_CONDENSE_MIN_CHARS", "1500"))  # CV plus courts : injectés tels quels
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "256"))
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "1000"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+TTS_VOICE = 'en'
+TTS_CACHE_MB = int(os.getenv("TTS_CACHE_MB", "32"))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")  # Optionnel : cache persistant entre redémarrages
+TTS_CACHE_DIR_MB = int(os.getenv("TTS_CACHE_DIR_MB", "128"))  # Plafond disque (sur Cloud Run le disque est en RAM)
+TTS_POOL_SIZE = int(os.getenv("TTS_POOL_SIZE", "8"))
+TTS_CONNECT_TIMEOUT = float(os.getenv("TTS_CONNECT_TIMEOUT", "3"))
+TTS_READ_TIMEOUT = float(os.getenv("TTS_READ_TIMEOUT", "15"))
+TTS_RETRIES = int(os.getenv("TTS_RETRIES", "2"))
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "6"))  # Phrases synthétisées en parallèle
+AUDIO_FORMAT = os.getenv("AUDIO_FORMAT", "opus")  # opus (ogg) ou mp3, 16 kHz mono
+AUDIO_BITRATE = os.getenv("AUDIO_BITRATE", "24k")
+AUDIO_TRIM_SILENCE = os.getenv("AUDIO_TRIM_SILENCE", "1") == "1"
+INLINE_AUDIO_MAX_BYTES = int(os.getenv("INLINE_AUDIO_MAX_BYTES", str(8 * 1024 * 1024)))  # Au-delà : upload_file
+UPLOAD_POLL_TIMEOUT = float(os.getenv("UPLOAD_POLL_TIMEOUT", "10"))
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "128"))
+MODEL_CACHE_TTL = int(os.getenv("MODEL_CACHE_TTL", "1800"))  # secondes
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "1") == "1"  # Contexte Gemini mis en cache (prompt + CV)
+CONTEXT_CACHE_MIN_CHARS = int(os.getenv("CONTEXT_CACHE_MIN_CHARS", "4500"))  # ~1024 tokens minimum côté API
+CONTEXT_CACHE_GRACE = int(os.getenv("CONTEXT_CACHE_GRACE", "180"))  # Survie après éviction locale : > plus longue requête (gunicorn --timeout 120)
+SCHEMA_INIT = os.getenv("SCHEMA_INIT", "background")  # background, startup (bloquant) ou off (python english_coach_backend.py migrate)
+SCHEMA_WAIT_TIMEOUT = float(os.getenv("SCHEMA_WAIT_TIMEOUT", "30"))  # Attente max d'une requête avant que le schéma soit prêt
+PREWARM = os.getenv("PREWARM", "1") == "1"  # Gemini, connexion DB, ffmpeg chargés en arrière-plan après l'import
+PREWARM_TTS = [t for t in os.getenv("PREWARM_TTS", "").split("|") if t.strip()]  # Phrases mises en cache au démarrage
 
 if not API_KEY: sys.exit("❌ CLÉ GEMINI MANQUANTE")
 if not DATABASE_URL: sys.exit("❌ DATABASE_URL MANQUANTE")
 
-try:
-    genai.configure(api_key=API_KEY.strip())
-except Exception as e: sys.exit(f"❌ ERREUR CONFIG GEMINI: {e}")
+def configure_gemini(module):
+    module.configure(api_key=API_KEY.strip())
+
+# Importés au premier usage (ou par le pré-chauffage) : google.generativeai prend ~1 s à l'import
+genai = LazyModule("google.generativeai", on_load=configure_gemini)
+caching = LazyModule("google.generativeai.caching", on_load=lambda _: genai.load())
+startup = metrics.Startup(IMPORT_STARTED)
+schema_ready = threading.Event()
 
 # Initialisation de l'application Flask
 app = Flask(__name__, static_folder='.', static_url_path='')
 CORS(app)
 
-# --- GESTION DE LA BASE DE DONNÉES (POSTGRES) ---
-def get_db_connection():
-    """Crée et retourne une connexion à PostgreSQL."""
-    try:
-        return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-    except Exception as e:
-        print(f"⚠️ Erreur DB: {e}")
-        return None
+# --- GESTION DE LA BASE DE DONNÉES (POSTGRES / SQLITE) ---
+# DATABASE_URL = DSN PostgreSQL, ou sqlite:///interview_sessions.db en local
+store = create_store(DATABASE_URL, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+hist_cache = HistoryCache(max_sessions=HISTORY_CACHE_SESSIONS, turns=HISTORY_TURNS)
+# Inserts d'historique groupés + nettoyage (fichiers Gemini...) hors du chemin de la requête.
+# Connexion dédiée : le writer n'attend jamais qu'un thread de requête libère le pool.
+writer = WriteBehind(create_store(DATABASE_URL, max_size=1, timeout=DB_POOL_TIMEOUT), max_queue=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE)
+atexit.register(writer.close)  # Vide la file à l'arrêt du worker
+
+@contextmanager
+def db_cursor():
+    """Transaction courte par opération : la connexion retourne au pool avant Gemini, ffmpeg et TTS."""
+    schema_ready.wait(SCHEMA_WAIT_TIMEOUT)  # Schéma créé en arrière-plan au démarrage
+    with store.transaction() as cur:
+        yield cur
+
+def sql(query):
+    return store.sql(query)
 
 def init_db():
     """Initialise les tables si elles n'existent pas."""
-    conn = get_db_connection()
-    if not conn: 
-        print("❌ Impossible d'initialiser la DB, connexion échouée.")
-        return
     try:
-        cur = conn.cursor()
-        # SCHEMA MIS À JOUR : Ajout de cv_content
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS sessions (
-                session_id TEXT PRIMARY KEY,
-                candidate_name TEXT,
-                job_title TEXT,
-                company_type TEXT,
-                cv_content TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        cur.execute('''CREATE TABLE IF NOT EXISTS history (id SERIAL PRIMARY KEY, session_id TEXT, role TEXT, content TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);''')
-        conn.commit()
-        conn.close()
+        store.init_schema()
         print("✅ DB Initialisée (Schema V4.0)")
+        return True
+    except StoreUnavailable as e:
+        print(f"❌ Impossible d'initialiser la DB, connexion échouée: {e}")
     except Exception as e: 
         print(f"❌ Erreur Init DB: {e}")
-
-init_db()
+    return False
 
 # --- Fonctions de l'Historique ---
 
 def save_msg(sid, role, txt):
-    """Enregistre un message dans l'historique."""
-    conn = get_db_connection()
-    if not conn: return
-    try:
-        cur = conn.cursor()
-        cur.execute("INSERT INTO history (session_id, role, content, timestamp) VALUES (%s, %s, %s, NOW())", (sid, role, txt))
-        conn.commit()
-        conn.close()
-    except Exception as e: print(f"Save Error: {e}")
+    """Enregistre un message dans l'historique (écriture différée, cache mis à jour tout de suite)."""
+    hist_cache.append(sid, {"role": role, "parts": [txt]})
+    writer.save(sid, role, txt)
 
 def get_hist(sid):
-    """Récupère l'historique pour Gemini (20 dernières entrées)."""
-    conn = get_db_connection()
-    if not conn: return []
+    """Récupère l'historique pour Gemini (HISTORY_TURNS dernières entrées)."""
+    cached = hist_cache.get(sid)
+    metrics.cache_event("history", cached is not None)
+    if cached is not None: return cached
+    # Read-your-writes : les messages encore en file doivent être en base avant la lecture
+    durable = writer.wait_for(sid)
+    try:
+        # Lecture de la fin seulement (index history(session_id, id)), puis remise dans l'ordre
+        with db_cursor() as cur:
+            cur.execute(sql("SELECT role, content FROM history WHERE session_id = %s ORDER BY id DESC LIMIT %s"), (sid, HISTORY_TURNS))
+            rows = cur.fetchall()
+        hist = [{"role": r['role'], "parts": [r['content']]} for r in reversed(rows)]
+        # Écritures encore en attente : lecture incomplète, on ne la fige pas dans le cache
+        if durable: hist_cache.put(sid, hist)
+        return list(hist)
+    except:
+        metrics.upstream_error("db")
+        return []
+
+def save_turn(sid, res):
+    """Enregistre la réponse du candidat et celle du coach."""
+    save_msg(sid, "user", res.get("transcription_user", "..."))
+    save_msg(sid, "model", res.get("coach_response_text", ""))
+
+def save_sess(sid, name, job, company, cv_content, cv_profile):
+    """Crée ou met à jour la session."""
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT role, content FROM history WHERE session_id = %s ORDER BY id ASC", (sid,))
-        rows = cur.fetchall()
-        conn.close()
-        return [{"role": r['role'], "parts": [r['content']]} for r in rows[-20:]]
-    except: return []
+        with db_cursor() as cur:
+            cur.execute(sql("""
+            INSERT INTO sessions (session_id, candidate_name, job_title, company_type, cv_content, cv_profile, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (session_id) DO UPDATE 
+            SET candidate_name = EXCLUDED.candidate_name, 
+                job_title = EXCLUDED.job_title, 
+                company_type = EXCLUDED.company_type,
+                cv_content = EXCLUDED.cv_content,
+                cv_profile = EXCLUDED.cv_profile
+            """), (sid, name, job, company, cv_content, cv_profile))
+    except Exception as e:
+        metrics.upstream_error("db")
+        print(f"⚠️ Erreur DB: {e}")
+
+def clean_cv(cv_content):
+    """Retire les caractères NUL (0x00) qui font planter PostgreSQL."""
+    return cv_content.replace('\x00', '') if cv_content else cv_content
+
+def known_profile(prev, cv_content):
+    """Profil déjà condensé si la session existe avec le même CV, sinon None."""
+    if prev and prev.get('cv_content') == cv_content and prev.get('cv_profile'):
+        return prev['cv_profile']
+    return None
 
 def get_sess(sid):
     """Récupère les détails de la session."""
-    conn = get_db_connection()
-    if not conn: return None
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM sessions WHERE session_id = %s", (sid,))
-        row = cur.fetchone()
-        conn.close()
-        return row
-    except: return None
+        with db_cursor() as cur:
+            cur.execute(sql("SELECT * FROM sessions WHERE session_id = %s"), (sid,))
+            return cur.fetchone()
+    except:
+        metrics.upstream_error("db")
+        return None
 
 # --- AUDIO G-TTS (Robuste - Plan B) ---
+# Cache adressé par contenu : la phrase d'accueil et les relances fréquentes
+# ne sont synthétisées qu'une fois (mémoire + disque si TTS_CACHE_DIR est défini).
+tts_client = TTSClient(pool_size=TTS_POOL_SIZE, timeout=(TTS_CONNECT_TIMEOUT, TTS_READ_TIMEOUT), retries=TTS_RETRIES)
+tts_cache = TTSCache(tts_client.fetch, max_bytes=TTS_CACHE_MB * 1024 * 1024, disk_dir=TTS_CACHE_DIR, max_disk_bytes=TTS_CACHE_DIR_MB * 1024 * 1024)
+tts_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+
 def generate_ai_voice(text):
     """Utilise l'API Google Translate TTS pour garantir l'audio."""
     try:
-        # Nettoyage et encodage du texte pour l'URL
-        clean_text = text.replace('\n', ' ').strip()
-        encoded_text = quote(clean_text)
-        
-        # Endpoint public TTS (tl=en pour l'anglais)
-        url = f"https://translate.google.com/translate_tts?ie=UTF-8&client=tw-ob&tl=en&q={encoded_text}"
-        
-        # Appel API simple (synchrone, pas de processus asynchrone qui plante)
-        response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
-        response.raise_for_status() # Lève une exception si le statut n'est pas 200
-        
-        # Conversion en Base64
-        b64 = base64.b64encode(response.content).decode('utf-8')
+        # Réponses longues : découpées en phrases, synthétisées en parallèle
+        with span("tts"):
+            b64 = tts_cache.synthesize_b64(text, voice=TTS_VOICE, executor=tts_pool)
+        metrics.audio_bytes("out", len(b64) * 3 // 4)
         return b64
-        
     except Exception as e:
+        metrics.upstream_error("tts")
         print(f"❌ CRITIQUE: Échec Audio G-TTS: {e}")
         return "" 
 
@@ -135,10 +202,18 @@ def clean_json(text):
         if len(lines) > 2: return "\n".join(lines[1:-1]).strip()
     return t
 
-def get_sys_prompt(name, job, company, cv_content=None):
-    """Crée l'instruction système pour Gemini avec injection du CV."""
+def get_sys_prompt(name, job, company, cv_content=None, cv_profile=None):
+    """Crée l'instruction système pour Gemini avec injection du CV (ou de son profil condensé)."""
     cv_injection = ""
-    if cv_content and cv_content.strip():
+    if cv_profile:
+        cv_injection = (
+            f"CONTEXTE CLÉ: Le profil de {name} (condensé de son CV) est fourni ci-dessous en JSON. "
+            f"Utilisez ces expériences, compétences et réalisations pour tous les exemples de 'better_response_example' que vous fournirez. "
+            f"Assurez-vous que les réponses modèles (masterclass) sont directement liées au profil. \n"
+            f"--- PROFIL CANDIDAT ---\n{cv_profile}\n"
+            f"--- FIN PROFIL ---\n"
+        )
+    elif cv_content and cv_content.strip():
         cv_injection = (
             f"CONTEXTE CLÉ: Le CV/Résumé de {name} est fourni ci-dessous. "
             f"Utilisez les expériences, compétences et réalisations listées dans ce CV pour améliorer la qualité et la pertinence de tous les exemples de 'better_response_example' que vous fournirez. "
@@ -154,24 +229,145 @@ def get_sys_prompt(name, job, company, cv_content=None):
         f"OUTPUT: JSON with fields: coach_response_text, transcription_user, score_pronunciation (0-10), feedback_intonation, feedback_grammar, better_response_example, next_step_advice."
     )
 
+def wait_file_active(u_file, timeout=UPLOAD_POLL_TIMEOUT):
+    """Attend la fin du PROCESSING avec un backoff exponentiel (0.1s, 0.2s, 0.4s... plafonné à 2s)."""
+    delay, deadline = 0.1, time.monotonic() + timeout
+    while u_file.state.name == "PROCESSING" and time.monotonic() < deadline:
+        metrics.retry("gemini_processing")
+        time.sleep(delay)
+        u_file = genai.get_file(u_file.name)
+        delay = min(delay * 2, 2.0)
+    return u_file
+
+def make_audio_part(audio, mime):
+    """Part audio pour send_message : inline si le clip est court, sinon via l'API Files.
+
+    Retourne (part, nom du fichier Gemini à supprimer ou None).
+    """
+    if len(audio) <= INLINE_AUDIO_MAX_BYTES:
+        return {"mime_type": mime, "data": audio}, None
+    with span("upload"):
+        u_file = genai.upload_file(io.BytesIO(audio), mime_type=mime)
+    with span("processing_wait"):
+        u_file = wait_file_active(u_file)
+    if u_file.state.name != "ACTIVE":
+        writer.submit(delete_gemini_file, u_file.name)
+        raise Exception("Gemini File Upload Failed")
+    return u_file, u_file.name
+
+def delete_gemini_file(name):
+    """Suppression du fichier Gemini, hors du chemin de la requête."""
+    try: genai.delete_file(name)
+    except Exception as e: print(f"⚠️ Suppression fichier Gemini: {e}")
+
+PROFILE_SCHEMA = {"type": "OBJECT", "properties": {
+    "headline": {"type": "STRING"},
+    "experiences": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "skills": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "achievements": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "education": {"type": "ARRAY", "items": {"type": "STRING"}}},
+    "required": ["headline", "experiences", "skills"]}
+PROFILE_CONFIG = {"response_mime_type": "application/json", "response_schema": PROFILE_SCHEMA}
+CONDENSE_INSTRUCTIONS = (
+    "Condense this CV into a compact candidate profile for a job interview coach. "
+    "experiences: one line each, 'role @ company (dates): key result with numbers'. "
+    "Keep only facts useful to build example answers. Max ~300 words.")
+
+def needs_condensing(cv_content):
+    return bool(cv_content) and len(cv_content.strip()) >= CV_CONDENSE_MIN_CHARS
+
+def compact_profile(text):
+    """JSON du profil renvoyé par Gemini, réécrit sans espaces inutiles."""
+    return json.dumps(json.loads(clean_json(text)), ensure_ascii=False, separators=(",", ":"))
+
+def condense_cv(cv_content):
+    """Condense le CV en profil structuré (JSON compact), une seule fois à /start_chat.
+
+    Retourne None si le CV est court (injecté tel quel) ou si Gemini échoue.
+    """
+    if not needs_condensing(cv_content): return None
+    try:
+        with span("condense"):
+            resp = genai.GenerativeModel(MODEL_NAME).generate_content([CONDENSE_INSTRUCTIONS, cv_content], generation_config=PROFILE_CONFIG)
+        return compact_profile(resp.text)
+    except Exception as e:
+        metrics.upstream_error("gemini")
+        print(f"⚠️ Condensation CV échouée, CV brut utilisé: {e}")
+        return None
+
+def build_session_model(sess):
+    """Construit le modèle de la session : contexte mis en cache côté Gemini si le prompt est assez long.
+
+    Retourne (modèle, contexte en cache ou None, tokens estimés du prompt système).
+    """
+    sys_prompt = get_sys_prompt(sess['candidate_name'], sess['job_title'], sess['company_type'], cv_content=sess['cv_content'], cv_profile=sess.get('cv_profile'))
+    prompt_tokens = estimate_tokens(sys_prompt)
+    if CONTEXT_CACHE and len(sys_prompt) >= CONTEXT_CACHE_MIN_CHARS:
+        try:
+            cached = caching.CachedContent.create(model=f"models/{MODEL_NAME}", system_instruction=sys_prompt, ttl=datetime.timedelta(seconds=MODEL_CACHE_TTL + CONTEXT_CACHE_GRACE))
+            return genai.GenerativeModel.from_cached_content(cached_content=cached), cached, prompt_tokens
+        except Exception as e:
+            metrics.upstream_error("gemini")
+            print(f"⚠️ Cache de contexte Gemini indisponible: {e}")
+    return genai.GenerativeModel(MODEL_NAME, system_instruction=sys_prompt), None, prompt_tokens
+
+# Pas de suppression à l'éviction : une requête peut encore utiliser le contexte,
+# c'est le TTL côté Gemini (MODEL_CACHE_TTL + CONTEXT_CACHE_GRACE) qui le retire.
+model_cache = ModelCache(max_entries=MODEL_CACHE_SIZE, ttl=MODEL_CACHE_TTL, name="model")
+
+def get_session_model(sess):
+    """Modèle réutilisé tant que le profil (nom, poste, entreprise, CV) ne change pas.
+
+    Retourne (modèle, tokens estimés du prompt système).
+    """
+    key = profile_key(sess['candidate_name'], sess['job_title'], sess['company_type'], sess['cv_content'], sess.get('cv_profile'))
+    model, _, prompt_tokens = model_cache.get_or_create(key, lambda: build_session_model(sess))
+    return model, prompt_tokens
+
+def budget_history(hist, prompt_tokens):
+    """Historique envoyé à Gemini : tours récents dans le budget restant après le prompt système."""
+    return fit_history(hist, max(PROMPT_TOKEN_BUDGET - prompt_tokens, SUMMARY_TOKEN_BUDGET), summary_tokens=SUMMARY_TOKEN_BUDGET)
+
 SCHEMA = {"type": "OBJECT", "properties": {
     "coach_response_text": {"type": "STRING"}, "transcription_user": {"type": "STRING"},
     "score_pronunciation": {"type": "NUMBER"}, "feedback_intonation": {"type": "STRING"},
     "feedback_grammar": {"type": "STRING"}, "better_response_example": {"type": "STRING"},
     "next_step_advice": {"type": "STRING"}},
     "required": ["coach_response_text", "transcription_user", "score_pronunciation", "better_response_example"]}
+ANALYZE_CONFIG = {"response_mime_type": "application/json", "response_schema": SCHEMA}
+
+def greeting(name, job):
+    return f"Hi {name}. I'm {COACH_NAME}. Let's start the interview for {job}. Tell me about yourself."
 
 # --- ROUTES FLASK ---
 
+@app.before_request
+def start_timing():
+    metrics.begin_request(request.endpoint)
+
+@app.after_request
+def add_server_timing(response):
+    """Durée de chaque étape dans l'en-tête Server-Timing (visible dans l'onglet Réseau)."""
+    timing = metrics.end_request(response.status_code)
+    if timing: response.headers['Server-Timing'] = timing
+    if request.endpoint not in ('health', 'prometheus_metrics'): startup.mark("first_response")
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, mimetype=content_type)
+
 @app.route('/')
 def index(): return app.send_static_file('index.html')
 
 @app.route('/health', methods=['GET'])
 def health():
-    conn = get_db_connection()
-    status = "ok" if conn else "disconnected"
-    if conn: conn.close()
-    return jsonify({"status": "ok", "db": status})
+    # 503 tant que le schéma n'est pas prêt : la sonde de démarrage attend avant d'envoyer du trafic
+    if not schema_ready.is_set(): return jsonify({"status": "starting", "startup": startup.phases}), 503
+    status = "ok" if store.ping() else "disconnected"
+    if status != "ok": metrics.upstream_error("db")
+    return jsonify({"status": "ok", "db": status, "startup": startup.phases})
 
 @app.route('/start_chat', methods=['POST'])
 def start_chat():
@@ -181,96 +377,163 @@ def start_chat():
     cv_content = d.get('cv_content', None) 
     
     # FIX CRITIQUE: Retire les caractères NUL (0x00) qui font planter PostgreSQL
-    if cv_content:
-        # On remplace les bytes nuls par rien pour nettoyer la string
-        cv_content = cv_content.replace('\x00', '') 
+    cv_content = clean_cv(cv_content)
     
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO sessions (session_id, candidate_name, job_title, company_type, cv_content, created_at)
-            VALUES (%s, %s, %s, %s, %s, NOW())
-            ON CONFLICT (session_id) DO UPDATE 
-            SET candidate_name = EXCLUDED.candidate_name, 
-                job_title = EXCLUDED.job_title, 
-                company_type = EXCLUDED.company_type,
-                cv_content = EXCLUDED.cv_content
-        """, (sid, d['candidate_name'], d['job_title'], d['company_type'], cv_content))
-        conn.commit()
-        conn.close()
+    # Profil condensé calculé une seule fois (réutilisé si le CV n'a pas changé)
+    with span("db_session"):
+        cv_profile = known_profile(get_sess(sid), cv_content)
+    if cv_profile is None: cv_profile = condense_cv(cv_content)
+    
+    with span("db_save"):
+        save_sess(sid, d['candidate_name'], d['job_title'], d['company_type'], cv_content, cv_profile)
 
-    msg = f"Hi {d['candidate_name']}. I'm {COACH_NAME}. Let's start the interview for {d['job_title']}. Tell me about yourself."
+    msg = greeting(d['candidate_name'], d['job_title'])
     save_msg(sid, "model", msg)
     
     audio = generate_ai_voice(msg)
     
     return jsonify({"coach_response_text": msg, "audio_base64": audio, "transcription_user": "", "score_pronunciation": 10, "feedback_grammar": "", "better_response_example": "N/A"})
 
+def read_audio(f):
+    """Transcodage en mémoire (pipe ffmpeg, aucun fichier temporaire)."""
+    data = f.read()
+    metrics.audio_bytes("in", len(data))
+    with span("transcode"):
+        audio, mime = prepare_audio(data, source_mime="video/webm", fmt=AUDIO_FORMAT, bitrate=AUDIO_BITRATE, trim_silence=AUDIO_TRIM_SILENCE)
+    metrics.audio_bytes("transcoded", len(audio))
+    return audio, mime
+
+def ask_gemini(sid, sess, audio, mime):
+    """Envoie le tour à Gemini, enregistre l'échange et renvoie l'analyse (sans audio)."""
+    # Modèle (prompt + CV) mis en cache par profil ; l'historique vient du cache LRU
+    with span("model"):
+        model, prompt_tokens = get_session_model(sess)
+    
+    with span("history"):
+        hist = budget_history(get_hist(sid), prompt_tokens)
+    chat = model.start_chat(history=hist)
+    
+    part, u_name = make_audio_part(audio, mime)
+    try:
+        with span("gemini"):
+            resp = chat.send_message([part, "Analyze."], generation_config=ANALYZE_CONFIG)
+    finally:
+        if u_name: writer.submit(delete_gemini_file, u_name)
+
+    with span("parse"):
+        res = json.loads(clean_json(resp.text))
+    with span("save"):
+        save_turn(sid, res)
+    return res
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     sid = request.form.get('session_id')
     f = request.files.get('audio')
     
-    sess = get_sess(sid)
+    with span("db_session"):
+        sess = get_sess(sid)
     if not sess: return jsonify({"error": "Session lost"}), 404
 
-    # Utiliser le CV sauvegardé pour le prompt
-    cv_for_prompt = sess['cv_content'] 
-
-    # 1. Traitement audio (inchangé)
-    path, mime = None, "video/webm"
+    # 1. Traitement audio
     try:
-        fd, t_webm = tempfile.mkstemp(suffix=".webm")
-        os.close(fd)
-        f.save(t_webm)
-        path = t_webm
-        if shutil.which("ffmpeg"):
-            try:
-                fd2, t_mp3 = tempfile.mkstemp(suffix=".mp3")
-                os.close(fd2)
-                AudioSegment.from_file(t_webm).export(t_mp3, format="mp3")
-                path, mime = t_mp3, "audio/mp3"
-            except: pass
+        audio, mime = read_audio(f)
     except: return jsonify({"error": "File error"}), 500
 
     # 2. Appel à Gemini
     try:
-        # Passation du CV au prompt
-        sys_prompt = get_sys_prompt(sess['candidate_name'], sess['job_title'], sess['company_type'], cv_content=cv_for_prompt)
-        model = genai.GenerativeModel(MODEL_NAME, system_instruction=sys_prompt)
-        
-        hist = get_hist(sid)
-        chat = model.start_chat(history=hist)
-        
-        u_file = genai.upload_file(path, mime_type=mime)
-        
-        retry = 0
-        while u_file.state.name == "PROCESSING" and retry < 10: 
-            time.sleep(0.5)
-            u_file = genai.get_file(u_file.name)
-            retry += 1
-            
-        if u_file.state.name != "ACTIVE": raise Exception("Gemini File Upload Failed")
-        
-        resp = chat.send_message([u_file, "Analyze."], generation_config=genai.GenerationConfig(response_mime_type="application/json", response_schema=SCHEMA))
-        
-        try:
-            genai.delete_file(u_file.name)
-            os.remove(t_webm)
-            if mime == "audio/mp3": os.remove(path)
-        except: pass
-
-        res = json.loads(clean_json(resp.text))
-        save_msg(sid, "user", res.get("transcription_user", "..."))
-        save_msg(sid, "model", res.get("coach_response_text", ""))
-        
+        res = ask_gemini(sid, sess, audio, mime)
         res["audio_base64"] = generate_ai_voice(res.get("coach_response_text"))
         
         return jsonify(res)
     except Exception as e:
+        metrics.upstream_error("gemini")
         print(f"CRITICAL: {e}")
         return jsonify({"error": str(e)}), 500
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """Variante Server-Sent Events de /analyze : chaque étape est envoyée dès qu'elle est prête.
+
+    Événements : `analysis` (transcription + scores), `coach` (coach_response_text),
+    `audio` (un segment MP3 base64 par phrase, dans l'ordre), puis `done` ou `error`.
+    """
+    sid = request.form.get('session_id')
+    f = request.files.get('audio')
+    
+    with span("db_session"):
+        sess = get_sess(sid)
+    if not sess: return jsonify({"error": "Session lost"}), 404
+
+    try:
+        audio, mime = read_audio(f)
+    except: return jsonify({"error": "File error"}), 500
+
+    req = metrics.current()
+
+    def events():
+        # Les en-têtes sont déjà partis : les étapes restent mesurées dans /metrics
+        metrics.resume(req)
+        try:
+            res = ask_gemini(sid, sess, audio, mime)
+        except Exception as e:
+            metrics.upstream_error("gemini")
+            print(f"CRITICAL: {e}")
+            yield sse("error", {"error": str(e)})
+            return
+        text = res.pop("coach_response_text", "")
+        yield sse("analysis", res)
+        yield sse("coach", {"coach_response_text": text})
+        try:
+            with span("tts"):
+                for i, chunk in enumerate(tts_cache.iter_b64(text, voice=TTS_VOICE, executor=tts_pool)):
+                    metrics.audio_bytes("out", len(chunk) * 3 // 4)
+                    yield sse("audio", {"index": i, "audio_base64": chunk})
+        except Exception as e:
+            metrics.upstream_error("tts")
+            print(f"❌ CRITIQUE: Échec Audio G-TTS: {e}")
+        metrics.resume(None)
+        yield sse("done", {})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- DÉMARRAGE ---
+
+def prewarm():
+    """Charge ce que la première requête paierait sinon : Gemini, connexion DB, ffmpeg, phrases TTS."""
+    try: genai.load()
+    except Exception as e: print(f"❌ ERREUR CONFIG GEMINI: {e}")
+    store.ping()
+    ffmpeg_path()
+    for text in PREWARM_TTS: generate_ai_voice(text)
+
+def bootstrap():
+    """Schéma (selon SCHEMA_INIT) puis pré-chauffage, sans retarder l'import du module."""
+    if SCHEMA_INIT == "startup": init_db()
+    if SCHEMA_INIT != "background": schema_ready.set()
+
+    def run():
+        if not schema_ready.is_set():
+            init_db()
+            schema_ready.set()  # Même en cas d'échec : /health signale alors la DB déconnectée
+        startup.mark("schema_ready")
+        if PREWARM:
+            prewarm()
+            startup.mark("prewarm")
+
+    # Sous gunicorn, le worker importe l'app après que le maître a ouvert le port
+    threading.Thread(target=run, name="bootstrap", daemon=True).start()
+
+if __name__ == '__main__' and sys.argv[1:] == ['migrate']:
+    # Migration explicite avant le déploiement (avec SCHEMA_INIT=off)
+    sys.exit(0 if init_db() else 1)
+
+bootstrap()
+startup.mark("import")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
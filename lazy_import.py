@@ -0,0 +1,37 @@
+"""Import différé des bibliothèques lourdes : le worker sert ses premières requêtes plus tôt."""
+import importlib, threading
+
+
+class LazyModule:
+    """Remplaçant d'un module, importé au premier accès à l'un de ses attributs.
+
+    - `on_load(module)` est appelé une seule fois, juste après l'import (ex. configure),
+    - `load()` force l'import (pré-chauffage en arrière-plan),
+    - une affectation (`lazy.attr = x`) remplace l'attribut sans importer le module
+      (doublures du benchmark).
+    """
+
+    def __init__(self, name, on_load=None):
+        d = self.__dict__
+        d["_name"], d["_on_load"], d["_module"], d["_overrides"] = name, on_load, None, {}
+        d["_lock"] = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._on_load: self._on_load(module)
+                    self.__dict__["_module"] = module
+        return self._module
+
+    def __getattr__(self, attr):
+        if attr in self._overrides: return self._overrides[attr]
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        self._overrides[attr] = value
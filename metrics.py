@@ -0,0 +1,167 @@
+"""Instrumentation : durée par étape (Prometheus + en-tête Server-Timing), compteurs, profilage des requêtes lentes."""
+import os, sys, time, asyncio, threading, contextvars, traceback
+from collections import Counter as Tally
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+REQUEST_SECONDS = Histogram("coach_request_seconds", "Durée totale des requêtes", ["route", "status"], buckets=BUCKETS)
+STAGE_SECONDS = Histogram("coach_stage_seconds", "Durée de chaque étape d'une requête", ["route", "stage"], buckets=BUCKETS)
+CACHE_EVENTS = Counter("coach_cache_events_total", "Accès aux caches", ["cache", "result"])
+RETRIES = Counter("coach_retries_total", "Nouvelles tentatives vers un service", ["upstream"])
+UPSTREAM_ERRORS = Counter("coach_upstream_errors_total", "Erreurs des services externes", ["upstream"])
+AUDIO_BYTES = Counter("coach_audio_bytes_total", "Octets audio reçus, transcodés et renvoyés", ["direction"])
+STARTUP_SECONDS = Gauge("coach_startup_seconds", "Jalons du démarrage, en secondes depuis le début de l'import", ["phase"])
+
+# Profilage échantillonné des requêtes lentes (désactivé si PROFILE_SLOW_MS=0).
+# Mode sync uniquement : en mode async toutes les requêtes partagent le thread de la
+# boucle, la pile échantillonnée mélangerait les requêtes (utiliser py-spy sur le worker).
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+
+_current = contextvars.ContextVar("coach_request", default=None)
+
+
+class _Request:
+    __slots__ = ("route", "start", "spans", "sampler")
+
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.spans = []
+        self.sampler = None
+
+
+def begin_request(route):
+    """À appeler au début de la requête (before_request)."""
+    req = _Request(route or "unknown")
+    if PROFILE_SLOW_MS > 0 and not _on_event_loop():
+        req.sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+        req.sampler.start()
+    _current.set(req)
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def end_request(status):
+    """Enregistre la durée totale et renvoie la valeur de l'en-tête Server-Timing."""
+    req = _current.get()
+    if req is None: return None
+    _current.set(None)
+    total = time.perf_counter() - req.start
+    REQUEST_SECONDS.labels(req.route, str(status)).observe(total)
+    if req.sampler is not None:
+        req.sampler.stop()
+        if total * 1000 >= PROFILE_SLOW_MS: req.sampler.report(f"{req.route} {total * 1000:.0f} ms")
+    parts = [f"{name};dur={dur * 1000:.1f}" for name, dur in req.spans]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def current():
+    """Requête en cours, à reprendre dans un générateur de réponse en streaming."""
+    return _current.get()
+
+
+def resume(req):
+    """Rattache les étapes suivantes à `req` (corps streamé après l'envoi des en-têtes)."""
+    _current.set(req)
+
+
+@contextmanager
+def span(stage):
+    """Mesure une étape de la requête en cours (fonctionne aussi autour d'un `await`)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        dur = time.perf_counter() - start
+        req = _current.get()
+        route = req.route if req is not None else "background"
+        STAGE_SECONDS.labels(route, stage).observe(dur)
+        if req is not None: req.spans.append((stage, dur))
+
+
+def cache_event(cache, hit):
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def retry(upstream):
+    RETRIES.labels(upstream).inc()
+
+
+def upstream_error(upstream):
+    UPSTREAM_ERRORS.labels(upstream).inc()
+
+
+def audio_bytes(direction, n):
+    AUDIO_BYTES.labels(direction).inc(n)
+
+
+class Startup:
+    """Jalons du démarrage à froid (import, schéma, pré-chauffage, première réponse).
+
+    Chaque jalon est enregistré une seule fois, en secondes depuis `started`
+    (time.monotonic() au début de l'import) : gauge Prometheus, /health et log.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def mark(self, phase):
+        if phase in self.phases: return
+        with self._lock:
+            if phase in self.phases: return
+            self.phases[phase] = elapsed = round(time.monotonic() - self.started, 3)
+        STARTUP_SECONDS.labels(phase).set(elapsed)
+        print(f"⏱️ Démarrage — {phase} : {elapsed:.2f} s")
+
+
+def exposition():
+    """(corps, content-type) pour la route /metrics."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class StackSampler:
+    """Échantillonne la pile d'un thread à intervalle fixe ; `report()` affiche les piles les plus fréquentes.
+
+    Suppose un thread par requête (mode sync) : sur une boucle asyncio, le thread
+    exécute aussi les autres requêtes et le rapport ne serait pas attribuable.
+    """
+
+    def __init__(self, thread_id, interval=0.01):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self): self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None: continue
+            stack = traceback.extract_stack(frame, limit=12)
+            self.samples[" > ".join(f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}" for f in stack[-6:])] += 1
+
+    def report(self, label, top=5):
+        total = sum(self.samples.values())
+        if not total: return
+        print(f"🐢 Requête lente {label} — {total} échantillons")
+        for stack, n in self.samples.most_common(top):
+            print(f"   {100 * n / total:5.1f}%  {stack}")
@@ -0,0 +1,72 @@
+"""Cache des modèles Gemini construits par profil de session (TTL + taille bornée)."""
+import time, hashlib, threading
+from collections import OrderedDict
+
+import metrics
+
+
+def profile_key(*fields):
+    """Empreinte du profil (nom, poste, entreprise, CV) : change dès qu'un champ change."""
+    h = hashlib.sha256()
+    for f in fields:
+        h.update((f or "").encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class ModelCache:
+    """LRU à expiration : `get_or_create(key, factory)` ne construit qu'une fois par clé.
+
+    `on_evict(valeur)` est appelé pour chaque entrée expirée ou évincée. Une
+    requête qui a obtenu la valeur juste avant peut encore s'en servir : ne pas
+    y libérer une ressource partagée sans délai de grâce.
+    """
+
+    def __init__(self, max_entries=128, ttl=1800, on_evict=None, name="model"):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        evicted = []
+        for key, (value, expires) in list(self._data.items()):
+            if expires <= now: evicted.append(self._data.pop(key)[0])
+        while len(self._data) > self.max_entries:
+            evicted.append(self._data.popitem(last=False)[1][0])
+        return evicted
+
+    def _evict(self, values):
+        if not self.on_evict: return
+        for v in values:
+            try: self.on_evict(v)
+            except Exception as e: print(f"⚠️ Éviction cache modèle: {e}")
+
+    def get_or_create(self, key, factory):
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._expire(now)
+            hit = self._data.get(key)
+            if hit is not None:
+                self._data.move_to_end(key)
+            else:
+                # Un seul thread construit l'entrée, les autres attendent
+                lock = self._building.setdefault(key, threading.Lock())
+        self._evict(evicted)
+        metrics.cache_event(self.name, hit is not None)
+        if hit is not None: return hit[0]
+
+        with lock:
+            with self._lock:
+                hit = self._data.get(key)
+            if hit is not None: return hit[0]
+            value = factory()
+            with self._lock:
+                self._data[key] = (value, time.monotonic() + self.ttl)
+                self._building.pop(key, None)
+                evicted = self._expire(time.monotonic())
+        self._evict([v for v in evicted if v is not value])
+        return value
@@ -0,0 +1,63 @@
+"""Assemblage du prompt sous budget de tokens : profil d'abord, puis les tours récents qui tiennent."""
+import re
+
+CHARS_PER_TOKEN = 4  # Estimation suffisante pour de l'anglais / du français
+
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def _turn_text(turn):
+    return " ".join(str(p) for p in turn["parts"])
+
+
+def _first_sentence(text, max_chars=160):
+    text = re.sub(r"\s+", " ", text or "").strip()
+    m = re.match(r"(.+?[.!?])(\s|$)", text)
+    s = m.group(1) if m else text
+    return s if len(s) <= max_chars else s[:max_chars - 1].rstrip() + "…"
+
+
+def summarize_turns(turns, max_tokens):
+    """Résumé extractif des tours plus anciens (première phrase de chaque tour, les plus récents gardés)."""
+    lines = []
+    for turn in turns:
+        who = "Coach" if turn["role"] == "model" else "Candidate"
+        lines.append(f"{who}: {_first_sentence(_turn_text(turn))}")
+    header = "Summary of earlier turns in this interview:\n"
+    while lines and estimate_tokens(header + "\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return header + "\n".join(lines) if lines else ""
+
+
+def fit_history(hist, budget, summary_tokens=200):
+    """Garde les tours les plus récents qui tiennent dans `budget` tokens.
+
+    Le dernier tour du coach (la question à laquelle l'audio répond) et ce qui
+    le suit sont toujours gardés mot pour mot, même au-delà du budget. Si les
+    tours plus anciens ne tiennent pas, jusqu'à `summary_tokens` de la place
+    restante vont à leur résumé, ajouté côté coach (`model`) en tête de
+    l'historique ; le reste aux tours les plus récents.
+
+    Seuls les tours de `hist` sont résumés : ce qui précède la fenêtre lue en
+    base (HISTORY_TURNS) n'est pas repris.
+    """
+    costs = [estimate_tokens(_turn_text(t)) for t in hist]
+    if sum(costs) <= budget: return list(hist)
+    keep = next((i for i in range(len(hist) - 1, -1, -1) if hist[i]["role"] == "model"), len(hist))
+    room = budget - sum(costs[keep:])
+    summary_room = max(0, min(summary_tokens, room))
+    room -= summary_room
+    start = keep
+    while start > 0 and costs[start - 1] <= room:
+        start -= 1
+        room -= costs[start]
+    # Place non utilisée par les tours gardés : elle revient au résumé
+    summary = summarize_turns(hist[:start], summary_room + max(room, 0)) if start else ""
+    kept = [dict(t, parts=list(t["parts"])) for t in hist[start:]]
+    if not summary: return kept
+    if kept and kept[0]["role"] == "model":
+        kept[0]["parts"].insert(0, summary)
+        return kept
+    return [{"role": "model", "parts": [summary]}] + kept
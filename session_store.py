@@ -0,0 +1,231 @@
+"""Couche de stockage des sessions : pool de connexions borné, PostgreSQL ou SQLite."""
+import re, time, queue, sqlite3, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+HISTORY_INDEX = "CREATE INDEX IF NOT EXISTS idx_history_session_id ON history (session_id, id)"
+
+
+class StoreUnavailable(Exception):
+    """Aucune connexion disponible (base injoignable ou pool épuisé)."""
+
+
+class SessionStore:
+    """Pool de connexions partagé entre les threads gunicorn.
+
+    - `checkout()` bloque au plus `timeout` secondes si le pool est plein,
+    - une connexion restée inactive plus de `ping_after` secondes est vérifiée
+      (SELECT 1) avant d'être rendue, et recréée si elle est morte,
+    - `transaction()` ouvre une transaction (commit / rollback automatique).
+    """
+    placeholder = "%s"
+
+    def __init__(self, max_size=4, timeout=5.0, ping_after=30.0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    # --- À implémenter par backend ---
+    def _connect(self): raise NotImplementedError
+    def _is_closed(self, conn): return False
+    def init_schema(self): raise NotImplementedError
+
+    def sql(self, query):
+        """Adapte la requête (écrite en style psycopg2) au backend."""
+        return query
+
+    # --- Pool ---
+    def _alive(self, conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try: conn.close()
+        except Exception: pass
+
+    def checkout(self):
+        """Emprunte une connexion saine au pool."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise StoreUnavailable("Pool DB épuisé")
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._is_closed(conn):
+                    self._discard(conn)
+                    continue
+                if time.monotonic() - last_used > self.ping_after and not self._alive(conn):
+                    self._discard(conn)
+                    continue
+                return conn
+        except Exception as e:
+            self._slots.release()
+            raise StoreUnavailable(str(e)) from e
+
+    def release(self, conn, commit=True):
+        """Termine la transaction en cours et rend la connexion au pool."""
+        try:
+            if commit: conn.commit()
+            else: conn.rollback()
+            self._idle.put((conn, time.monotonic()))
+        except Exception:
+            # Connexion cassée : on la jette, le pool en recréera une
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Fournit un curseur dans une transaction unique."""
+        conn = self.checkout()
+        ok = False
+        try:
+            yield conn.cursor()
+            ok = True
+        finally:
+            self.release(conn, commit=ok)
+
+    def ping(self):
+        try:
+            with self.transaction() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        while True:
+            try: conn, _ = self._idle.get_nowait()
+            except queue.Empty: return
+            self._discard(conn)
+
+
+class PostgresStore(SessionStore):
+    def __init__(self, dsn, **kw):
+        super().__init__(**kw)
+        self.dsn = dsn
+
+    def _connect(self):
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+        return psycopg2.connect(self.dsn, cursor_factory=RealDictCursor, connect_timeout=int(self.timeout) or 1)
+
+    def _is_closed(self, conn):
+        return bool(conn.closed)
+
+    def init_schema(self):
+        with self.transaction() as cur:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    candidate_name TEXT,
+                    job_title TEXT,
+                    company_type TEXT,
+                    cv_content TEXT,
+                    cv_profile TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            ''')
+            cur.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS cv_profile TEXT")
+            cur.execute('''CREATE TABLE IF NOT EXISTS history (id SERIAL PRIMARY KEY, session_id TEXT, role TEXT, content TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);''')
+            cur.execute(HISTORY_INDEX)
+
+
+def _dict_row(cursor, row):
+    return {c[0]: v for c, v in zip(cursor.description, row)}
+
+
+class SqliteStore(SessionStore):
+    placeholder = "?"
+
+    def __init__(self, path, **kw):
+        super().__init__(**kw)
+        self.path = path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = _dict_row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def sql(self, query):
+        return re.sub(r"\bNOW\(\)", "CURRENT_TIMESTAMP", query.replace("%s", "?"))
+
+    def init_schema(self):
+        with self.transaction() as cur:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    candidate_name TEXT,
+                    job_title TEXT,
+                    company_type TEXT,
+                    cv_content TEXT,
+                    cv_profile TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cur.execute('''CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, role TEXT, content TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+            cur.execute(HISTORY_INDEX)
+            # Les anciennes bases locales (interview_sessions.db) n'ont pas toutes les colonnes
+            cur.execute("PRAGMA table_info(sessions)")
+            columns = [r["name"] for r in cur.fetchall()]
+            for col in ("cv_content", "cv_profile"):
+                if col not in columns: cur.execute(f"ALTER TABLE sessions ADD COLUMN {col} TEXT")
+
+
+class HistoryCache:
+    """LRU borné des derniers tours par session (write-through depuis save_msg).
+
+    Chaque entrée garde au plus `turns` messages ; au-delà de `max_sessions`
+    sessions, la moins récemment utilisée est évincée.
+    """
+
+    def __init__(self, max_sessions=256, turns=20):
+        self.max_sessions = max_sessions
+        self.turns = turns
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None: return None
+            self._data.move_to_end(sid)
+            return list(entry)
+
+    def put(self, sid, messages):
+        with self._lock:
+            self._data[sid] = list(messages[-self.turns:])
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+
+    def append(self, sid, message):
+        """Ajoute un message si la session est en cache (sinon la prochaine lecture ira en base)."""
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None: return
+            entry.append(message)
+            del entry[:-self.turns]
+            self._data.move_to_end(sid)
+
+    def invalidate(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+def create_store(url, **kw):
+    """Choisit le backend selon l'URL : `sqlite:///chemin.db` ou DSN PostgreSQL."""
+    if url.startswith("sqlite:///"):
+        return SqliteStore(url[len("sqlite:///"):], **kw)
+    return PostgresStore(url, **kw)
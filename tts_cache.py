@@ -0,0 +1,347 @@
+"""Cache audio TTS adressé par contenu (mémoire LRU + disque optionnel)."""
+import os, re, time, base64, asyncio, hashlib, tempfile, threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+import metrics
+
+TTS_URL = os.getenv("TTS_URL", "https://translate.google.com/translate_tts?ie=UTF-8&client=tw-ob&tl={voice}&q={text}")
+MAX_CHUNK_CHARS = 180  # L'endpoint refuse les textes trop longs (~200 caractères)
+
+
+def normalize_text(text):
+    """Normalise le texte pour que deux phrases identiques partagent la même clé."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def split_sentences(text, max_chars=MAX_CHUNK_CHARS):
+    """Découpe le texte aux fins de phrase, puis aux virgules / espaces si une phrase dépasse `max_chars`."""
+    chunks = []
+    for sentence in re.split(r"(?<=[.!?;:])\s+", normalize_text(text)):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(", ", 0, max_chars)
+            if cut <= 0: cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0: cut = max_chars - 1  # Aucun séparateur : coupe franche à max_chars
+            chunks.append(sentence[:cut + 1].strip())
+            sentence = sentence[cut + 1:].strip()
+        if sentence: chunks.append(sentence)
+    return chunks
+
+
+def cache_key(text, voice):
+    return hashlib.sha256(f"{voice}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class TTSClient:
+    """Client HTTP keep-alive (pool de connexions partagé) vers l'endpoint TTS."""
+
+    def __init__(self, pool_size=8, timeout=(3.05, 15), retries=2, backoff=0.3):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Session créée au premier appel (requests n'est importé qu'à ce moment-là)."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    session.headers.update({'User-Agent': 'Mozilla/5.0'})
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def fetch(self, text, voice="en"):
+        """Synthétise `text` et renvoie les octets MP3 bruts."""
+        import requests
+        url = TTS_URL.format(voice=voice, text=quote(normalize_text(text)))
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                return response.content
+            except requests.RequestException as e:
+                status = getattr(e.response, "status_code", None)
+                # Erreur client (texte refusé...) : inutile de réessayer, sauf 429
+                if attempt == self.retries or (status and 400 <= status < 500 and status != 429): raise
+                metrics.retry("tts")
+                time.sleep(self.backoff * (2 ** attempt))
+
+
+class _Entry:
+    __slots__ = ("audio", "b64")
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.b64 = base64.b64encode(audio).decode('utf-8')  # Encodé une seule fois
+
+    @property
+    def size(self):
+        return len(self.audio) + len(self.b64)
+
+
+class _Flight:
+    """Requête TTS en cours, partagée par les appels identiques simultanés."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class TTSCache:
+    """LRU en mémoire borné en octets, adossé à un répertoire disque facultatif.
+
+    Le disque est lui aussi borné (`max_disk_bytes`) : les fichiers les moins
+    récemment utilisés sont supprimés au-delà.
+
+    Les demandes identiques qui arrivent en même temps sont fusionnées :
+    un seul appel à `fetch`, les autres threads attendent son résultat.
+    """
+
+    def __init__(self, fetch, max_bytes=32 * 1024 * 1024, disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.fetch = fetch
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._disk = OrderedDict()  # clé -> taille, du moins récent au plus récent
+        self._disk_bytes = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # --- Mémoire ---
+    def _get_mem(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None: self._data.move_to_end(key)
+            return entry
+
+    def _put_mem(self, key, entry):
+        if entry.size > self.max_bytes: return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None: self._bytes -= old.size
+            self._data[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted.size
+
+    # --- Disque ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.mp3")
+
+    def _load_disk_index(self):
+        """Reprend les fichiers d'un démarrage précédent, les plus anciens en tête."""
+        files = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".mp3") and e.is_file()]
+        for e in sorted(files, key=lambda e: e.stat().st_mtime):
+            self._disk[e.name[:-4]] = e.stat().st_size
+            self._disk_bytes += e.stat().st_size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try: os.remove(self._disk_path(key))
+            except OSError: pass
+
+    def _get_disk(self, key):
+        if not self.disk_dir: return None
+        try:
+            with open(self._disk_path(key), "rb") as fh:
+                audio = fh.read()
+        except OSError:
+            return None
+        with self._lock:
+            if key in self._disk: self._disk.move_to_end(key)
+        return audio
+
+    def _put_disk(self, key, audio):
+        if not self.disk_dir: return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".part")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(audio)
+            os.replace(tmp, self._disk_path(key))  # Écriture atomique
+        except OSError as e:
+            print(f"⚠️ Cache TTS disque: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(audio) - self._disk.pop(key, 0)
+            self._disk[key] = len(audio)
+            self._evict_disk()
+
+    # --- API ---
+    def get_entry(self, text, voice="en"):
+        key = cache_key(text, voice)
+        entry = self._get_mem(key)
+        metrics.cache_event("tts", entry is not None)
+        if entry is not None: return entry
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None: raise flight.error
+            return flight.entry
+
+        try:
+            audio = self._get_disk(key)
+            from_disk = audio is not None
+            if self.disk_dir: metrics.cache_event("tts_disk", from_disk)
+            if not from_disk: audio = self.fetch(text, voice)
+            entry = _Entry(audio)
+            self._put_mem(key, entry)
+            if not from_disk: self._put_disk(key, audio)
+            flight.entry = entry
+            return entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def get_audio(self, text, voice="en"):
+        """Octets MP3 bruts pour `text`."""
+        return self.get_entry(text, voice).audio
+
+    def get_b64(self, text, voice="en"):
+        """Audio MP3 encodé en base64 pour `text`."""
+        return self.get_entry(text, voice).b64
+
+    def iter_b64(self, text, voice="en", executor=None):
+        """Segments MP3 base64 phrase par phrase, dans l'ordre, dès que chacun est prêt (streaming).
+
+        Toujours découpé en phrases : la première phrase peut être jouée
+        pendant que les suivantes sont synthétisées.
+        """
+        chunks = split_sentences(text)
+        if executor is None:
+            for c in chunks: yield self.get_b64(c, voice)
+            return
+        futures = [executor.submit(self.get_entry, c, voice) for c in chunks]
+        for fut in futures: yield fut.result().b64
+
+    def synthesize_b64(self, text, voice="en", executor=None):
+        """Synthèse phrase par phrase, en parallèle sur `executor`, segments MP3 concaténés dans l'ordre.
+
+        Chaque phrase est mise en cache séparément : le temps total suit la
+        phrase la plus longue, pas la longueur de la réponse.
+        """
+        text = normalize_text(text)
+        if not text: return ""
+        # Texte court : une seule requête, et l'entrée garde son base64 déjà calculé
+        if len(text) <= MAX_CHUNK_CHARS: return self.get_b64(text, voice)
+        chunks = split_sentences(text)
+        if executor is None:
+            parts = [self.get_audio(c, voice) for c in chunks]
+        else:
+            parts = list(executor.map(lambda c: self.get_audio(c, voice), chunks))
+        return base64.b64encode(b"".join(parts)).decode('utf-8')
+
+
+class AsyncTTS:
+    """Pendant asyncio de TTSCache (même cache mémoire / disque), client httpx keep-alive.
+
+    `concurrency` borne le nombre de requêtes simultanées vers l'endpoint TTS.
+    """
+
+    def __init__(self, cache, pool_size=8, timeout=(3.05, 15), retries=2, backoff=0.3, concurrency=16):
+        self.cache = cache
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._limit = asyncio.Semaphore(concurrency)
+        self._flights = {}
+        self._client = None
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+            connect, read = self.timeout
+            self._client = httpx.AsyncClient(
+                headers={'User-Agent': 'Mozilla/5.0'},
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, text, voice="en"):
+        import httpx
+        url = TTS_URL.format(voice=voice, text=quote(normalize_text(text)))
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._limit:
+                    response = await self._http().get(url)
+                response.raise_for_status()
+                return response.content
+            except httpx.HTTPError as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                if attempt == self.retries or (status and 400 <= status < 500 and status != 429): raise
+                metrics.retry("tts")
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    async def get_entry(self, text, voice="en"):
+        key = cache_key(text, voice)
+        entry = self.cache._get_mem(key)
+        metrics.cache_event("tts", entry is not None)
+        if entry is not None: return entry
+
+        # Tâche détachée, partagée par les demandes identiques : un appelant annulé
+        # (client déconnecté) n'interrompt pas la synthèse attendue par les autres
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = asyncio.ensure_future(self._fill(key, text, voice))
+            flight.add_done_callback(lambda f: (self._flights.pop(key, None), f.cancelled() or f.exception()))
+        return await asyncio.shield(flight)
+
+    async def _fill(self, key, text, voice):
+        """Disque puis endpoint TTS ; remplit le cache même si plus personne n'attend."""
+        audio = await asyncio.to_thread(self.cache._get_disk, key)
+        from_disk = audio is not None
+        if self.cache.disk_dir: metrics.cache_event("tts_disk", from_disk)
+        if not from_disk: audio = await self.fetch(text, voice)
+        entry = _Entry(audio)
+        self.cache._put_mem(key, entry)
+        if not from_disk: await asyncio.to_thread(self.cache._put_disk, key, audio)
+        return entry
+
+    async def synthesize_b64(self, text, voice="en"):
+        """Comme TTSCache.synthesize_b64 : phrases synthétisées en parallèle, segments concaténés."""
+        text = normalize_text(text)
+        if not text: return ""
+        if len(text) <= MAX_CHUNK_CHARS: return (await self.get_entry(text, voice)).b64
+        entries = await asyncio.gather(*(self.get_entry(c, voice) for c in split_sentences(text)))
+        return base64.b64encode(b"".join(e.audio for e in entries)).decode('utf-8')
+
+    async def iter_b64(self, text, voice="en"):
+        """Segments base64 phrase par phrase, dans l'ordre (streaming)."""
+        tasks = [asyncio.ensure_future(self.get_entry(c, voice)) for c in split_sentences(text)]
+        try:
+            for task in tasks: yield (await task).b64
+        finally:
+            for task in tasks: task.cancel()
@@ -0,0 +1,157 @@
+"""File d'écriture différée : inserts d'historique groupés et nettoyage hors du chemin de la requête."""
+import time, queue, threading
+
+import metrics
+
+_STOP = object()
+
+
+class WriteBehind:
+    """Deux threads de fond alimentés par des files bornées.
+
+    - `save()` met un message d'historique en file ; les messages sont insérés
+      par lots (INSERT multi-lignes), avec retries et backoff. Un lot qui
+      échoue encore est gardé et retenté toutes les `retry_interval` secondes,
+      dans la limite de `max_queue` lignes. L'ordre par session est conservé :
+      au-delà des limites, les lignes sont abandonnées (métrique + log), jamais
+      écrites en court-circuitant la file.
+    - `submit()` exécute une tâche de nettoyage (suppression fichier Gemini...).
+    - `wait_for(sid)` bloque jusqu'à ce que les écritures de la session soient
+      en base : la lecture suivante voit toujours ses propres écritures.
+    - `close()` vide les files (appelé à l'arrêt du worker).
+
+    `store` doit être réservé au writer (pool d'une connexion) : partagé avec
+    les requêtes, il peut être épuisé précisément quand la charge est forte.
+    """
+
+    def __init__(self, store, max_queue=1000, batch_size=100, retries=3, backoff=0.2, put_timeout=5.0, retry_interval=5.0):
+        self.store = store
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.put_timeout = put_timeout
+        self.retry_interval = retry_interval
+        self._writes = queue.Queue(max_queue)
+        self._tasks = queue.Queue(max_queue)
+        self._pending = {}
+        self._failed = []  # Lignes non écrites, retentées avant le lot suivant
+        self.max_failed = max_queue
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._run_writes, name="write-behind", daemon=True),
+            threading.Thread(target=self._run_tasks, name="cleanup", daemon=True),
+        ]
+        for t in self._threads: t.start()
+
+    # --- API ---
+    def save(self, sid, role, txt):
+        with self._cond:
+            self._pending[sid] = self._pending.get(sid, 0) + 1
+        try:
+            # File pleine : on bloque (back-pressure) puis on abandonne le message
+            self._writes.put((sid, role, txt), timeout=self.put_timeout)
+        except queue.Full:
+            self._drop([(sid, role, txt)], "file d'écriture pleine")
+
+    def submit(self, fn, *args):
+        try:
+            self._tasks.put_nowait((fn, args))
+        except queue.Full:
+            self._run_task(fn, args)
+
+    def wait_for(self, sid, timeout=5.0):
+        """True quand plus aucune écriture de `sid` n'est en attente."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending.get(sid), timeout)
+
+    def close(self, timeout=10.0):
+        # Jamais bloquant (handler atexit) : si une file reste pleine, le thread daemon est abandonné
+        for q in (self._writes, self._tasks):
+            try: q.put(_STOP, timeout=timeout / 2)
+            except queue.Full: print("⚠️ Write-behind : file pleine à l'arrêt, arrêt sans vidage")
+        for t in self._threads: t.join(timeout / 2)
+
+    # --- Historique ---
+    def _run_writes(self):
+        stop = False
+        while not stop:
+            with self._cond: retrying = bool(self._failed)
+            batch = []
+            try:
+                item = self._writes.get(timeout=self.retry_interval if retrying else None)
+                if item is _STOP: stop = True
+                else: batch.append(item)
+            except queue.Empty:
+                pass
+            while not stop and len(batch) < self.batch_size:
+                try: item = self._writes.get_nowait()
+                except queue.Empty: break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            rows = self._take_failed() + batch
+            for i in range(0, len(rows), self.batch_size):
+                if not self._flush(rows[i:i + self.batch_size]):
+                    # Premier lot en échec : tout ce qui suit attend aussi, pour garder l'ordre des id
+                    self._retry_later(rows[i:])
+                    break
+        lost = self._take_failed()
+        if lost: print(f"❌ Historique : {len(lost)} messages non écrits à l'arrêt (base injoignable)")
+
+    def _take_failed(self):
+        with self._cond:
+            rows, self._failed = self._failed, []
+        return rows
+
+    def _flush(self, batch):
+        values = ", ".join(["(%s, %s, %s, NOW())"] * len(batch))
+        params = [v for row in batch for v in row]
+        query = self.store.sql(f"INSERT INTO history (session_id, role, content, timestamp) VALUES {values}")
+        for attempt in range(self.retries + 1):
+            try:
+                with self.store.transaction() as cur:
+                    cur.execute(query, params)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    metrics.upstream_error("db")
+                    print(f"Save Error: {e} ({len(batch)} messages, nouvel essai dans {self.retry_interval:g} s)")
+                    return False
+                metrics.retry("db")
+                time.sleep(self.backoff * (2 ** attempt))
+        self._done(batch)
+        return True
+
+    def _retry_later(self, rows):
+        """Garde les lignes (toujours « en attente » pour wait_for), au plus `max_failed`."""
+        with self._cond:
+            self._failed.extend(rows)
+            overflow = self._failed[:max(0, len(self._failed) - self.max_failed)]
+            del self._failed[:len(overflow)]
+        if overflow: self._drop(overflow, "panne DB prolongée")
+
+    def _done(self, rows):
+        with self._cond:
+            for row in rows:
+                n = self._pending.get(row[0], 0) - 1
+                if n > 0: self._pending[row[0]] = n
+                else: self._pending.pop(row[0], None)
+            self._cond.notify_all()
+
+    def _drop(self, rows, reason):
+        """Abandon explicite (les plus anciens d'abord) : compté et journalisé, jamais silencieux."""
+        metrics.upstream_error("db")
+        print(f"❌ Historique : {len(rows)} messages abandonnés ({reason})")
+        self._done(rows)
+
+    # --- Nettoyage ---
+    def _run_tasks(self):
+        while True:
+            item = self._tasks.get()
+            if item is _STOP: break
+            self._run_task(*item)
+
+    def _run_task(self, fn, args):
+        try: fn(*args)
+        except Exception as e: print(f"⚠️ Tâche de fond échouée ({getattr(fn, '__name__', fn)}): {e}")